@@ -0,0 +1,122 @@
+# bench_payload.py - Benchmark do payload de /ask (tamanho e serialização)
+"""
+Compara a resposta antiga de /ask (com extracted_info, encoder padrão do
+FastAPI) com a resposta enxuta padrão serializada com orjson.
+
+Uso:
+    python bench_payload.py [--iterations 2000]
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+import orjson
+from server import DEFAULT_ASK_FIELDS
+
+
+def _tool_output(title: str, items: int) -> str:
+    """Saída típica de ferramenta: JSON dentro de string, como o LLM retorna"""
+    entries = [
+        {
+            "cargo": f"{title} {i}",
+            "empresa": f"Empresa {i}",
+            "periodo": "2019 - 2023",
+            "responsabilidades": ["Liderança técnica", "Arquitetura de serviços", "Mentoria"],
+            "conquistas": ["Redução de 40% no custo de infraestrutura"],
+        }
+        for i in range(items)
+    ]
+    return "```json\n" + json.dumps(entries, indent=2, ensure_ascii=False) + "\n```"
+
+
+def sample_result() -> dict:
+    """Resultado completo de ask_question, como produzido pelo agent"""
+    extracted_info = {
+        "complexity": "complex",
+        "extract_experience": _tool_output("Engenheiro de Software", 6),
+        "extract_skills": _tool_output("Habilidade", 8),
+        "analyze_career_progression": "Análise estruturada da carreira. " * 60,
+        "validation": "APROVADO",
+    }
+    return {
+        "question": "Como foi a progressão profissional?",
+        "answer": "O candidato evoluiu de desenvolvedor a líder técnico. " * 15,
+        "confidence": 0.87,
+        "partial": False,
+        "workflow_path": [
+            "classifier",
+            "tool_selector",
+            "information_extractor",
+            "context_analyzer",
+            "answer_generator",
+            "quality_validator",
+            "confidence_calculator",
+        ],
+        "tools_used": ["extract_experience", "extract_skills", "analyze_career_progression"],
+        "question_type": "career",
+        "attempts": 1,
+        "complexity": "complex",
+        "validation": "APROVADO",
+        "cv_id": "4eb8ceea0afc5b32",
+        "extracted_info": extracted_info,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def legacy_render(result: dict) -> bytes:
+    """Serialização antiga: jsonable_encoder + json.dumps (JSONResponse)"""
+    return json.dumps(
+        jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def lean_render(result: dict) -> bytes:
+    """Serialização nova: campos padrão + jsonable_encoder + orjson (ORJSONResponse)"""
+    return orjson.dumps(
+        jsonable_encoder({field: result[field] for field in DEFAULT_ASK_FIELDS})
+    )
+
+
+def _time_per_call(render, result: dict, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render(result)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    result = sample_result()
+    rows = []
+    for name, render in (("antigo", legacy_render), ("enxuto", lean_render)):
+        body = render(result)
+        rows.append(
+            (
+                name,
+                len(body),
+                len(gzip.compress(body)),
+                _time_per_call(render, result, args.iterations),
+            )
+        )
+
+    print(f"{'payload':<8} {'bytes':>8} {'gzip':>8} {'serialização (µs)':>19}")
+    for name, size, gzipped, micros in rows:
+        print(f"{name:<8} {size:>8} {gzipped:>8} {micros:>19.1f}")
+
+    (_, old_size, _, old_us), (_, new_size, new_gzip, new_us) = rows
+    print(
+        f"\nRedução: {100 * (1 - new_size / old_size):.1f}% no tamanho "
+        f"({100 * (1 - new_gzip / old_size):.1f}% com gzip), "
+        f"{old_us / new_us:.1f}x mais rápido para serializar"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,62 @@ import tempfile
 import os
 import json
 import asyncio
-from typing import Dict, Any, List
+import time
+from graphlib import TopologicalSorter
+from typing import Dict, Any, List, Optional
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain.tools import Tool
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
-import PyPDF2
 from datetime import datetime
 import logging
 from models import CVAgentState
+from cv_versions import CVDocument, CVDocumentStore
 
 logger = logging.getLogger(__name__)
 
+# Prazo padrão (segundos) de uma pergunta, do início do grafo à resposta
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get("CV_AGENT_REQUEST_TIMEOUT", "60"))
+# Tempo mínimo restante para iniciar uma validação ou nova tentativa
+DEADLINE_RESERVE_SECONDS = 5.0
+# Prefixo da validação quando o prazo impediu validar ou tentar de novo; a
+# resposta é entregue como parcial e não recebe o peso da validação
+DEADLINE_VALIDATION = "PRAZO_ESGOTADO"
+
+# Seções do CV enviadas a cada ferramenta, a principal primeiro; a entrada só
+# é reduzida quando a seção principal foi detectada, senão vai o CV inteiro.
+# O resultado em cache só vale para uma nova versão se a entrada for idêntica.
+# Habilidades e projetos também aparecem dentro das experiências.
+# extract_personal_info não está aqui: contatos costumam ficar em blocos sem
+# título reconhecido, então ela sempre lê o texto completo.
+TOOL_SECTIONS = {
+    "extract_experience": ("experience",),
+    "extract_skills": ("skills", "summary", "experience", "projects", "certifications"),
+    "extract_education": ("education", "certifications"),
+    "extract_projects": ("projects", "experience"),
+    # Derivada: recebe a saída de extract_experience, que lê só a experiência
+    "analyze_career_progression": ("experience",),
+}
+
 
 class CVAgent:
     def __init__(self, openai_api_key: str):
         self.llm = ChatOpenAI(
             model="gpt-4o-mini", temperature=0.1, api_key=openai_api_key
         )
-        self.cv_content = ""
+        self.cv_document = None
+        self.cv_documents = CVDocumentStore()
+        self.metrics = {
+            "llm_calls": 0,
+            "llm_calls_cancelled": 0,
+            "llm_calls_skipped": 0,
+            "tool_tasks_cancelled": 0,
+            "requests_cancelled": 0,
+            "deadlines_exceeded": 0,
+            "tool_cache_hits": 0,
+        }
+        self._graph_image = b""
+        self._graph_mermaid = ""
         self.setup_tools()
         self.setup_graph()
 
@@ -35,6 +72,40 @@ class CVAgent:
             "analyze_career_progression": self.analyze_career_progression,
         }
 
+        # Entradas de cada ferramenta: sem dependências a ferramenta lê suas
+        # seções do CV; com dependências agendadas recebe a saída estruturada
+        # delas, e sem elas lê apenas as próprias seções (TOOL_SECTIONS)
+        self.tool_inputs = {
+            "analyze_career_progression": ("extract_experience",),
+        }
+
+        # Valida o grafo de dependências (prepare() detecta ciclos)
+        TopologicalSorter(self.tool_inputs).prepare()
+
+    def resolve_tools(self, tool_names: List[str], document) -> List[str]:
+        """Ordena as ferramentas em ordem topológica.
+
+        Dependências só são agendadas se também foram selecionadas ou já estão
+        em cache, para nunca acrescentar uma leitura extra do CV.
+        """
+        graph = {}
+        pending = list(tool_names)
+        while pending:
+            tool_name = pending.pop()
+            if tool_name in graph:
+                continue
+            graph[tool_name] = tuple(
+                dep
+                for dep in self.tool_inputs.get(tool_name, ())
+                if dep in tool_names or self._is_cached(document, dep)
+            )
+            pending.extend(graph[tool_name])
+        return list(TopologicalSorter(graph).static_order())
+
+    def _is_cached(self, document, tool_name: str) -> bool:
+        fingerprint = document.tool_input(TOOL_SECTIONS.get(tool_name, ()))[1]
+        return document.get_cached(tool_name, fingerprint) is not None
+
     def setup_graph(self):
         """Configura o grafo de execução do Agent"""
         workflow = StateGraph(CVAgentState)
@@ -82,6 +153,24 @@ class CVAgent:
 
         self.app = workflow.compile()
 
+    # === PRAZOS E CANCELAMENTO ===
+
+    def _time_left(self, state: CVAgentState) -> float:
+        """Segundos restantes até o prazo da requisição"""
+        deadline = state.get("deadline")
+        if not deadline:
+            return float("inf")
+        return deadline - time.monotonic()
+
+    async def _ainvoke(self, messages: list):
+        """Chama o LLM contabilizando chamadas canceladas"""
+        self.metrics["llm_calls"] += 1
+        try:
+            return await self.llm.ainvoke(messages)
+        except asyncio.CancelledError:
+            self.metrics["llm_calls_cancelled"] += 1
+            raise
+
     # === NODES DO WORKFLOW ===
 
     async def classify_question(self, state: CVAgentState) -> CVAgentState:
@@ -111,7 +200,7 @@ class CVAgent:
         Retorne apenas: TIPO|COMPLEXIDADE
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=classification_prompt)])
+        response = await self._ainvoke([HumanMessage(content=classification_prompt)])
         classification = response.content.strip().split("|")
 
         question_type = classification[0].lower()
@@ -173,24 +262,59 @@ class CVAgent:
         tools_to_use = state["tools_used"]
         extracted_data = {}
 
-        # Execute tools concorrently using asyncio.gather
+        # O estado referencia o CV pelo id; o texto vive apenas no documento
+        document = self.cv_documents.get(state["cv_id"])
+        if document is None:
+            raise Exception("CV da pergunta não está mais disponível")
+
+        # Cada ferramenta roda assim que suas dependências terminam
+        tasks: Dict[str, asyncio.Task] = {}
+        failed = set()
+
         async def run_tool(tool_name: str) -> tuple[str, str]:
             """Execute a single tool and return (tool_name, result)"""
             try:
-                if tool_name in self.tools:
-                    result = await self.tools[tool_name](state["cv_content"])
-                    return tool_name, result
-                else:
+                if tool_name not in self.tools:
+                    failed.add(tool_name)
                     return tool_name, f"Ferramenta {tool_name} não encontrada"
+
+                inputs = [d for d in self.tool_inputs.get(tool_name, ()) if d in tasks]
+                upstream = [(await tasks[dep])[1] for dep in inputs]
+                missing = [dep for dep in inputs if dep in failed]
+                if missing:
+                    failed.add(tool_name)
+                    return tool_name, f"Dependências indisponíveis: {', '.join(missing)}"
+
+                tool_text, fingerprint = document.tool_input(
+                    TOOL_SECTIONS.get(tool_name, ())
+                )
+                cached = document.get_cached(tool_name, fingerprint)
+                if cached is not None:
+                    self.metrics["tool_cache_hits"] += 1
+                    return tool_name, cached
+
+                # Ferramentas derivadas recebem a saída compacta quando agendada
+                if inputs:
+                    result = await self.tools[tool_name](*upstream)
+                else:
+                    result = await self.tools[tool_name](tool_text)
+                document.tool_cache[tool_name] = (fingerprint, result)
+                return tool_name, result
+            except asyncio.CancelledError:
+                self.metrics["tool_tasks_cancelled"] += 1
+                raise
             except Exception as e:
                 logger.error(f"Erro ao usar ferramenta {tool_name}: {e}")
+                failed.add(tool_name)
                 return tool_name, f"Erro na extração: {str(e)}"
 
-        # Run all tools concurrently
+        # Run tools in topological order with maximum concurrency; tools_used
+        # keeps only the selected tools, which is what confidence scores
         if tools_to_use:
-            tasks = [run_tool(tool_name) for tool_name in tools_to_use]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
+            for tool_name in self.resolve_tools(tools_to_use, document):
+                tasks[tool_name] = asyncio.create_task(run_tool(tool_name))
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
             for result in results:
                 if isinstance(result, Exception):
                     logger.error(f"Erro na execução de ferramenta: {result}")
@@ -208,15 +332,16 @@ class CVAgent:
         question = state["current_question"]
         extracted_info = state["extracted_info"]
 
-        # Filtrar informações relevantes para a pergunta
+        # Filtrar informações relevantes para a pergunta (sem reaninhar a
+        # análise e a validação de tentativas anteriores)
         relevant_info = {}
         for key, value in extracted_info.items():
-            if key != "complexity" and value:
+            if key not in ("complexity", "context_analysis", "validation") and value:
                 relevant_info[key] = value
 
         context_analysis = f"""
         Pergunta: {question}
-        Informações extraídas: {json.dumps(relevant_info, indent=2, ensure_ascii=False)}
+        Informações extraídas: {json.dumps(relevant_info, ensure_ascii=False)}
         
         Contexto analisado e preparado para geração de resposta.
         """
@@ -279,7 +404,7 @@ class CVAgent:
         Responda:
         """
 
-        response = await self.llm.ainvoke(
+        response = await self._ainvoke(
             [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=generation_prompt),
@@ -297,6 +422,16 @@ class CVAgent:
         question = state["current_question"]
         attempts = state.get("answer_attempts", 0)
 
+        # Sem tempo para validar: entrega a resposta atual sem validá-la
+        if self._time_left(state) < DEADLINE_RESERVE_SECONDS:
+            self.metrics["llm_calls_skipped"] += 1
+            state["answer_attempts"] = attempts + 1
+            state["workflow_path"].append("quality_validator")
+            state["extracted_info"]["validation"] = (
+                f"{DEADLINE_VALIDATION} (validação não executada)"
+            )
+            return state
+
         validation_prompt = f"""
         Avalie a qualidade desta resposta:
         
@@ -313,7 +448,7 @@ class CVAgent:
         Retorne apenas: APROVADO ou REJEITAR_MOTIVO
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=validation_prompt)])
+        response = await self._ainvoke([HumanMessage(content=validation_prompt)])
         validation_result = response.content.strip()
 
         state["answer_attempts"] = attempts + 1
@@ -326,6 +461,12 @@ class CVAgent:
 
         if validation_result.startswith("APROVADO"):
             state["extracted_info"]["validation"] = "APROVADO"
+        elif self._time_left(state) < DEADLINE_RESERVE_SECONDS:
+            # Rejeitada, mas uma nova tentativa não caberia no prazo
+            self.metrics["llm_calls_skipped"] += 1
+            state["extracted_info"]["validation"] = (
+                f"{DEADLINE_VALIDATION}: {validation_result}"
+            )
         else:
             state["extracted_info"]["validation"] = validation_result
 
@@ -336,7 +477,7 @@ class CVAgent:
         validation = state["extracted_info"].get("validation", "")
         attempts = state.get("answer_attempts", 0)
 
-        if validation.startswith("APROVADO") or attempts >= 2:
+        if validation.startswith(("APROVADO", DEADLINE_VALIDATION)) or attempts >= 2:
             return "approved"
         elif "REJEITAR" in validation and attempts < 2:
             return "retry"
@@ -390,7 +531,7 @@ class CVAgent:
         Formato: JSON com lista de experiências
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
     async def extract_skills(self, cv_text: str) -> str:
@@ -411,7 +552,7 @@ class CVAgent:
         Formato: JSON estruturado
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
     async def extract_education(self, cv_text: str) -> str:
@@ -431,7 +572,7 @@ class CVAgent:
         Formato: JSON estruturado
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
     async def extract_projects(self, cv_text: str) -> str:
@@ -450,7 +591,7 @@ class CVAgent:
         Formato: JSON estruturado
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
     async def extract_personal_info(self, cv_text: str) -> str:
@@ -470,15 +611,15 @@ class CVAgent:
         Formato: JSON estruturado
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
-    async def analyze_career_progression(self, cv_text: str) -> str:
-        """Analisa progressão profissional"""
+    async def analyze_career_progression(self, experience: str) -> str:
+        """Analisa progressão profissional a partir das experiências (extraídas ou seção do CV)"""
         prompt = f"""
-        Analise a progressão profissional no CV:
+        Analise a progressão profissional a partir das experiências do CV:
         
-        CV: {cv_text}
+        Experiências: {experience}
         
         Analise:
         - Crescimento de responsabilidades
@@ -490,11 +631,14 @@ class CVAgent:
         Formato: Análise estruturada
         """
 
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self._ainvoke([HumanMessage(content=prompt)])
         return response.content
 
     async def process_cv(self, file_content: bytes, filename: str) -> dict:
         """Processa CV e extrai texto"""
+        # Import tardio: PyPDF2 só é necessário no upload
+        import PyPDF2
+
         try:
             # Criar arquivo temporário
             with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
@@ -508,32 +652,73 @@ class CVAgent:
                 for page in pdf_reader.pages:
                     text += page.extract_text() + "\n"
 
-            self.cv_content = text
-
             # Limpeza
             os.unlink(tmp_file_path)
 
+            version_info = self._register_cv_version(text, filename)
+
             return {
                 "status": "success",
                 "filename": filename,
                 "text_length": len(text),
                 "pages": len(pdf_reader.pages),
+                **version_info,
             }
 
         except Exception as e:
             logger.error(f"Erro no processamento do CV: {e}")
             raise Exception(f"Erro no processamento: {str(e)}")
 
-    async def ask_question(self, question: str) -> dict:
-        """Processa pergunta usando o grafo LangGraph"""
-        if not self.cv_content:
+    def _register_cv_version(self, text: str, filename: str) -> dict:
+        """Liga o CV à versão anterior e reaproveita extrações de seções inalteradas"""
+        document = CVDocument(text, filename)
+        previous = self.cv_documents.find_previous(document)
+
+        version_info = {"cv_id": document.id, "previous_version": None}
+        if previous is not None:
+            if previous.id == document.id:
+                # Mesmo texto: mantém o documento e todo o seu cache
+                document = previous
+            else:
+                document.inherit_cache(previous, TOOL_SECTIONS)
+            changed = document.changed_sections(previous)
+            version_info.update(
+                previous_version=previous.filename,
+                changed_sections=changed,
+                reused_tools=sorted(document.tool_cache),
+                stale_tools=sorted(
+                    name
+                    for name in previous.tool_cache
+                    if name not in document.tool_cache
+                ),
+            )
+            logger.info(
+                f"CV {filename} ligado a {previous.filename}: seções alteradas {changed}"
+            )
+
+        self.cv_documents.add(document)
+        self.cv_document = document
+        self.cv_documents.compress_idle(keep=self.cv_document)
+        return version_info
+
+    async def ask_question(self, question: str, timeout: float = None) -> dict:
+        """Processa pergunta usando o grafo LangGraph dentro de um prazo"""
+        if self.cv_document is None:
             raise Exception("CV não foi processado ainda")
 
+        # O CV ativo nunca é comprimido: seria descomprimido na próxima pergunta
+        self.cv_documents.compress_idle(keep=self.cv_document)
+        # O prazo do cliente só pode encurtar o padrão, nunca removê-lo
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout deve ser positivo")
+        timeout = min(timeout or DEFAULT_REQUEST_TIMEOUT, DEFAULT_REQUEST_TIMEOUT)
+        deadline = time.monotonic() + timeout
+
         try:
             # Estado inicial
             initial_state = CVAgentState(
                 messages=[],
-                cv_content=self.cv_content,
+                cv_id=self.cv_document.id,
                 current_question=question,
                 question_type="",
                 extracted_info={},
@@ -542,62 +727,114 @@ class CVAgent:
                 workflow_path=[],
                 answer_attempts=0,
                 final_answer="",
+                deadline=deadline,
             )
 
-            # Executar o grafo
-            result = await self.app.ainvoke(initial_state)
+            # Executar o grafo guardando o último estado para respostas parciais
+            result = initial_state
+            partial = False
+            try:
+                async with asyncio.timeout(timeout):
+                    async for result in self.app.astream(
+                        initial_state, stream_mode="values"
+                    ):
+                        pass
+            except TimeoutError:
+                self.metrics["deadlines_exceeded"] += 1
+                partial = True
+                logger.warning(f"Prazo de {timeout}s excedido: {result['workflow_path']}")
+
+            # Validação ou nova tentativa puladas pelo prazo também tornam a resposta parcial
+            validation = result["extracted_info"].get("validation", "")
+            partial = partial or validation.startswith(DEADLINE_VALIDATION)
 
             return {
                 "question": question,
-                "answer": result["final_answer"],
+                "answer": result["final_answer"]
+                or "Tempo limite excedido antes de gerar uma resposta.",
                 "confidence": result["confidence_score"],
+                "partial": partial,
                 "workflow_path": result["workflow_path"],
                 "tools_used": result["tools_used"],
                 "question_type": result["question_type"],
                 "attempts": result["answer_attempts"],
-                "extracted_info": {
-                    k: v
-                    for k, v in result["extracted_info"].items()
-                    if k not in ["context_analysis"]
-                },  # Reduzir payload
+                # Saídas brutas das ferramentas ficam em get_extraction (/extraction)
+                "complexity": result["extracted_info"].get("complexity", ""),
+                "validation": result["extracted_info"].get("validation", ""),
+                "cv_id": initial_state["cv_id"],
                 "timestamp": datetime.now().isoformat(),
             }
 
+        except asyncio.CancelledError:
+            self.metrics["requests_cancelled"] += 1
+            logger.info(f"Consulta cancelada: {question}")
+            raise
         except Exception as e:
             logger.error(f"Erro na consulta: {e}")
             raise Exception(f"Erro na consulta: {str(e)}")
 
+    def get_extraction(self, cv_id: str = None, tools: List[str] = None) -> Optional[dict]:
+        """Retorna as saídas brutas das ferramentas já extraídas para um CV (None se ausente)"""
+        document = self.cv_documents.get(cv_id) if cv_id else self.cv_document
+        if document is None:
+            return None
+
+        return {
+            "cv_id": document.id,
+            "extracted_info": {
+                name: result
+                for name, (_, result) in document.tool_cache.items()
+                if not tools or name in tools
+            },
+        }
+
     def get_tools(self) -> dict:
         """Retorna lista de ferramentas disponíveis"""
         return list(self.tools.keys())
 
     def is_cv_loaded(self) -> bool:
         """Verifica se CV foi carregado"""
-        return bool(self.cv_content)
+        return self.cv_document is not None
 
     def get_cv_length(self) -> int:
         """Retorna tamanho do texto do CV"""
-        return len(self.cv_content) if self.cv_content else 0
+        return self.cv_document.text_length if self.cv_document else 0
+
+    def get_metrics(self) -> dict:
+        """Retorna métricas de trabalho evitado por prazos e cancelamentos"""
+        return dict(self.metrics)
+
+    def get_memory_report(self) -> dict:
+        """Retorna o uso de memória por CV mantido em memória"""
+        self.cv_documents.compress_idle(keep=self.cv_document)
+        return self.cv_documents.memory_report()
 
     def is_ready(self) -> bool:
         """Verifica se o agent está pronto"""
         return self.app is not None
 
     def generate_graph_image(self) -> bytes:
-        """Gera imagem PNG do grafo LangGraph"""
+        """Gera imagem PNG do grafo LangGraph (renderizada uma única vez)"""
+        if self._graph_image:
+            return self._graph_image
+
         try:
             # Gerar a imagem do grafo
-            graph_image = self.app.get_graph().draw_mermaid_png()
-            return graph_image
+            self._graph_image = self.app.get_graph().draw_mermaid_png()
+            return self._graph_image
         except Exception as e:
             logger.error(f"Erro ao gerar imagem do grafo: {e}")
             # Retorna uma imagem vazia em caso de erro
             return b''
 
     def get_graph_mermaid(self) -> str:
-        """Retorna o código Mermaid do grafo"""
+        """Retorna o código Mermaid do grafo (renderizado uma única vez)"""
+        if self._graph_mermaid:
+            return self._graph_mermaid
+
         try:
-            return self.app.get_graph().draw_mermaid()
+            self._graph_mermaid = self.app.get_graph().draw_mermaid()
+            return self._graph_mermaid
         except Exception as e:
             logger.error(f"Erro ao gerar código Mermaid: {e}")
             return ""
@@ -0,0 +1,333 @@
+# cv_versions.py - Versões de CV, seções e cache incremental de extração
+import os
+import re
+import sys
+import json
+import time
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import xxhash
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+# Número máximo de versões de CV mantidas em memória
+MAX_CV_VERSIONS = int(os.environ.get("CV_AGENT_MAX_CV_VERSIONS", "1000"))
+# Similaridade mínima (Jaccard das linhas) para ligar uploads de nomes diferentes
+SIMILARITY_THRESHOLD = 0.5
+# Com o mesmo candidato no nome do arquivo basta uma similaridade menor, mas
+# nomes genéricos (cv.pdf, curriculo.pdf) não podem ligar pessoas diferentes
+FILENAME_SIMILARITY_THRESHOLD = 0.3
+# Segundos sem acesso até o texto e o cache de um CV serem comprimidos com zstd
+COMPRESS_IDLE_SECONDS = float(os.environ.get("CV_AGENT_COMPRESS_IDLE_SECONDS", "600"))
+ZSTD_LEVEL = 3
+
+# Seção implícita com o conteúdo anterior ao primeiro título (nome, contato)
+HEADER_SECTION = "header"
+
+# Títulos reconhecidos (pt/en); a linha inteira precisa ser um dos títulos
+SECTION_HEADINGS = {
+    "summary": (
+        "resumo", "resumo profissional", "sobre", "sobre mim", "perfil",
+        "perfil profissional", "objetivo", "objetivo profissional",
+        "summary", "professional summary", "about", "about me", "profile", "objective",
+    ),
+    "experience": (
+        "experiência", "experiências", "experiencia", "experiencias",
+        "experiência profissional", "experiencia profissional",
+        "experiências profissionais", "histórico profissional",
+        "experience", "work experience", "professional experience",
+        "employment", "employment history", "work history",
+    ),
+    "education": (
+        "formação", "formacao", "formação acadêmica", "formacao academica",
+        "educação", "educacao", "education",
+    ),
+    "certifications": (
+        "certificações", "certificacoes", "certificados", "cursos e certificações",
+        "certifications", "licenses", "licenses & certifications",
+    ),
+    "skills": (
+        "habilidades", "habilidades técnicas", "competências", "competencias",
+        "competências técnicas", "tecnologias", "skills", "technical skills",
+        "technologies",
+    ),
+    "projects": ("projetos", "projetos pessoais", "projects", "portfólio", "portfolio"),
+    "languages": ("idiomas", "languages"),
+}
+MAX_HEADING_LENGTH = 40
+
+# Sufixos de versão removidos do nome do arquivo para identificar o candidato
+VERSION_SUFFIX = re.compile(
+    r"[\s_\-.]*(v\d+|vers[aã]o\s*\d*|version\s*\d*|final|revisad[oa]|atualizad[oa]"
+    r"|updated|novo|new|\(\d+\)|\d{4}[\-_]?\d{2}(?:[\-_]?\d{2})?)$"
+)
+
+
+def _hash(text: str) -> str:
+    return xxhash.xxh3_64_hexdigest(text.encode("utf-8"))
+
+
+def candidate_key(filename: str) -> str:
+    """Normaliza o nome do arquivo removendo sufixos de versão"""
+    stem = os.path.splitext(os.path.basename(filename or ""))[0].lower().strip()
+    previous = None
+    while stem and stem != previous:
+        previous = stem
+        stem = VERSION_SUFFIX.sub("", stem)
+    return stem
+
+
+def _heading_for(line: str) -> Optional[str]:
+    """Retorna o nome da seção se a linha for um título reconhecido"""
+    normalized = line.strip().rstrip(":").lower()
+    if not normalized or len(normalized) > MAX_HEADING_LENGTH:
+        return None
+    for section, headings in SECTION_HEADINGS.items():
+        if normalized in headings:
+            return section
+    return None
+
+
+def split_sections(text: str) -> Dict[str, str]:
+    """Divide o texto do CV em seções pelos títulos reconhecidos"""
+    sections: Dict[str, List[str]] = {HEADER_SECTION: []}
+    current = HEADER_SECTION
+    for line in text.splitlines():
+        heading = _heading_for(line)
+        if heading:
+            current = heading
+            sections.setdefault(current, [])
+        sections[current].append(line)
+    return {name: "\n".join(lines) for name, lines in sections.items() if lines}
+
+
+def _line_hashes(text: str) -> array:
+    """Hashes de 32 bits das linhas, únicos e ordenados, em um array compacto"""
+    hashes = {
+        xxhash.xxh32_intdigest(line.strip().encode("utf-8"))
+        for line in text.splitlines()
+        if line.strip()
+    }
+    return array("I", sorted(hashes))
+
+
+class CVDocument:
+    """Uma versão de CV com hashes de seção e cache de resultados das ferramentas.
+
+    O texto é imutável e identificado pelo hash do conteúdo; após ficar ocioso,
+    texto e cache são comprimidos com zstd e descomprimidos no próximo acesso.
+    """
+
+    __slots__ = (
+        "id",
+        "filename",
+        "candidate",
+        "text_length",
+        "section_hashes",
+        "line_hashes",
+        "last_access",
+        "_text",
+        "_tool_cache",
+        "_compressed",
+    )
+
+    def __init__(self, text: str, filename: str):
+        self.id = _hash(text)
+        self.filename = filename
+        self.candidate = candidate_key(filename)
+        self.text_length = len(text)
+        self.section_hashes = {
+            name: _hash(content) for name, content in split_sections(text).items()
+        }
+        self.line_hashes = _line_hashes(text)
+        self.last_access = time.monotonic()
+        self._text = text
+        # tool_name -> (fingerprint das seções cobertas, resultado)
+        self._tool_cache: Dict[str, Tuple[str, str]] = {}
+        self._compressed = None
+
+    @property
+    def text(self) -> str:
+        self._touch()
+        return self._text
+
+    @property
+    def tool_cache(self) -> Dict[str, Tuple[str, str]]:
+        self._touch()
+        return self._tool_cache
+
+    @property
+    def is_compressed(self) -> bool:
+        return self._compressed is not None
+
+    def _touch(self) -> None:
+        self.last_access = time.monotonic()
+        if self._compressed is not None:
+            payload = json.loads(zstandard.ZstdDecompressor().decompress(self._compressed))
+            self._text = payload["text"]
+            self._tool_cache = {
+                name: tuple(entry) for name, entry in payload["tool_cache"].items()
+            }
+            self._compressed = None
+
+    def compress(self) -> None:
+        """Comprime texto e cache com zstd, liberando as strings originais"""
+        if self._compressed is not None:
+            return
+        payload = json.dumps(
+            {"text": self._text, "tool_cache": self._tool_cache}, ensure_ascii=False
+        )
+        self._compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+            payload.encode("utf-8")
+        )
+        self._text = None
+        self._tool_cache = None
+
+    def memory_size(self) -> int:
+        """Estimativa em bytes da memória ocupada pelo documento"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.line_hashes)
+        size += sys.getsizeof(self.filename) + sys.getsizeof(self.candidate)
+        size += sys.getsizeof(self.section_hashes) + sum(
+            sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.section_hashes.items()
+        )
+        if self._compressed is not None:
+            return size + sys.getsizeof(self._compressed)
+
+        size += sys.getsizeof(self._text) + sys.getsizeof(self._tool_cache)
+        for name, (fingerprint, result) in self._tool_cache.items():
+            size += sys.getsizeof(name) + sys.getsizeof(fingerprint) + sys.getsizeof(result)
+        return size
+
+    def tool_input(self, sections: Iterable[str]) -> Tuple[str, str]:
+        """Texto das seções lidas por uma ferramenta e o fingerprint desse texto.
+
+        A primeira seção é a principal da ferramenta: só quando ela foi
+        detectada a entrada é reduzida às seções listadas. Caso contrário
+        (ex.: "Tools & Technologies" não reconhecido) a ferramenta recebe o
+        texto completo. O fingerprint é o hash exato da entrada, então o cache
+        só é reaproveitado quando a ferramenta receberia o mesmo texto.
+        """
+        sections = tuple(sections)
+        if not sections or sections[0] not in self.section_hashes:
+            return self.text, self.id
+
+        parts = [
+            content
+            for name, content in split_sections(self.text).items()
+            if name in sections
+        ]
+        text = "\n".join(parts)
+        return text, _hash(text)
+
+    def get_cached(self, tool_name: str, fingerprint: str) -> Optional[str]:
+        cached = self.tool_cache.get(tool_name)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+        return None
+
+    def similarity(self, other: "CVDocument", mine: set = None) -> float:
+        """Similaridade de Jaccard entre as linhas dos dois textos.
+
+        `mine` é o set de self.line_hashes, para quem compara um documento
+        com muitos outros construí-lo uma única vez.
+        """
+        if not self.line_hashes or not other.line_hashes:
+            return 0.0
+        if mine is None:
+            mine = set(self.line_hashes)
+        common = sum(1 for h in other.line_hashes if h in mine)
+        return common / (len(self.line_hashes) + len(other.line_hashes) - common)
+
+    def changed_sections(self, previous: "CVDocument") -> List[str]:
+        """Seções adicionadas, removidas ou alteradas em relação à versão anterior"""
+        names = set(self.section_hashes) | set(previous.section_hashes)
+        return sorted(
+            name
+            for name in names
+            if self.section_hashes.get(name) != previous.section_hashes.get(name)
+        )
+
+    def inherit_cache(self, previous: "CVDocument", tool_sections: Dict[str, tuple]) -> List[str]:
+        """Reaproveita resultados cujas seções não mudaram; retorna as ferramentas reaproveitadas"""
+        reused = []
+        for tool_name, (fingerprint, result) in previous.tool_cache.items():
+            if self.tool_input(tool_sections.get(tool_name, ()))[1] == fingerprint:
+                self.tool_cache[tool_name] = (fingerprint, result)
+                reused.append(tool_name)
+        return sorted(reused)
+
+
+class CVDocumentStore:
+    """Guarda as versões recentes de CV e liga novos uploads à versão anterior"""
+
+    def __init__(self, max_versions: int = MAX_CV_VERSIONS):
+        self.max_versions = max_versions
+        self.documents: "OrderedDict[str, CVDocument]" = OrderedDict()
+
+    def find_previous(self, document: CVDocument) -> Optional[CVDocument]:
+        """Localiza a versão anterior pelo candidato (nome do arquivo) ou pelo texto"""
+        if document.id in self.documents:
+            return self.documents[document.id]
+
+        mine = set(document.line_hashes)
+        for candidate in reversed(self.documents.values()):
+            if (
+                document.candidate
+                and candidate.candidate == document.candidate
+                and document.similarity(candidate, mine) >= FILENAME_SIMILARITY_THRESHOLD
+            ):
+                return candidate
+
+        best, best_score = None, SIMILARITY_THRESHOLD
+        for candidate in self.documents.values():
+            score = document.similarity(candidate, mine)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def get(self, cv_id: str) -> Optional[CVDocument]:
+        return self.documents.get(cv_id)
+
+    def add(self, document: CVDocument) -> None:
+        self.documents[document.id] = document
+        self.documents.move_to_end(document.id)
+        while len(self.documents) > self.max_versions:
+            self.documents.popitem(last=False)
+
+    def compress_idle(
+        self, idle_seconds: float = COMPRESS_IDLE_SECONDS, keep: CVDocument = None
+    ) -> int:
+        """Comprime documentos sem acesso há mais de idle_seconds, exceto `keep`"""
+        cutoff = time.monotonic() - idle_seconds
+        compressed = 0
+        for document in self.documents.values():
+            if document is keep:
+                continue
+            if not document.is_compressed and document.last_access < cutoff:
+                document.compress()
+                compressed += 1
+        return compressed
+
+    def memory_report(self) -> dict:
+        """Bytes por documento (sessão de CV) mantido em memória"""
+        documents = [
+            {
+                "cv_id": document.id,
+                "filename": document.filename,
+                "text_length": document.text_length,
+                "compressed": document.is_compressed,
+                "bytes": document.memory_size(),
+            }
+            for document in self.documents.values()
+        ]
+        total = sum(d["bytes"] for d in documents)
+        return {
+            "documents": len(documents),
+            "compressed": sum(1 for d in documents if d["compressed"]),
+            "total_bytes": total,
+            "avg_bytes_per_document": total // len(documents) if documents else 0,
+            "per_document": documents,
+        }
@@ -0,0 +1,75 @@
+# graph_artifacts.py - Artefatos pré-renderizados do grafo LangGraph
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = os.environ.get(
+    "CV_AGENT_GRAPH_ARTIFACTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_artifacts"),
+)
+MERMAID_FILENAME = "langgraph.mmd"
+PNG_FILENAME = "langgraph.png"
+
+
+def _artifact_path(filename: str) -> str:
+    return os.path.join(ARTIFACTS_DIR, filename)
+
+
+def _read_artifact(filename: str) -> bytes:
+    """Lê um artefato do disco, retornando bytes vazios se não existir"""
+    try:
+        with open(_artifact_path(filename), "rb") as file:
+            return file.read()
+    except OSError:
+        return b""
+
+
+def _write_artifact(filename: str, data: bytes) -> None:
+    """Grava um artefato no disco (falhas são apenas registradas)"""
+    try:
+        os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+        with open(_artifact_path(filename), "wb") as file:
+            file.write(data)
+    except OSError as e:
+        logger.warning(f"Não foi possível gravar artefato {filename}: {e}")
+
+
+def load_graph_mermaid() -> str:
+    """Retorna o código Mermaid pré-renderizado, ou string vazia"""
+    return _read_artifact(MERMAID_FILENAME).decode("utf-8")
+
+
+def load_graph_png() -> bytes:
+    """Retorna a imagem PNG pré-renderizada, ou bytes vazios"""
+    return _read_artifact(PNG_FILENAME)
+
+
+def save_graph_artifacts(mermaid_code: str, image_data: bytes) -> None:
+    """Persiste os artefatos renderizados para os próximos boots"""
+    if mermaid_code:
+        _write_artifact(MERMAID_FILENAME, mermaid_code.encode("utf-8"))
+    if image_data:
+        _write_artifact(PNG_FILENAME, image_data)
+
+
+def ensure_graph_artifacts(cv_agent) -> None:
+    """Renderiza e persiste os artefatos que ainda não existem no disco"""
+    mermaid_code = "" if load_graph_mermaid() else cv_agent.get_graph_mermaid()
+    image_data = b"" if load_graph_png() else cv_agent.generate_graph_image()
+    save_graph_artifacts(mermaid_code, image_data)
+
+
+if __name__ == "__main__":
+    # Executado no build da imagem: compila o grafo e renderiza Mermaid/PNG
+    from cv_agent import CVAgent
+
+    logging.basicConfig(level=logging.INFO)
+
+    # A compilação do grafo não chama a API; uma chave fictícia basta no build
+    agent = CVAgent(os.environ.get("OPENAI_API_KEY") or "sk-build-placeholder")
+    ensure_graph_artifacts(agent)
+    logger.info(
+        f"Artefatos do grafo em {ARTIFACTS_DIR}: "
+        f"mermaid={bool(load_graph_mermaid())}, png={bool(load_graph_png())}"
+    )
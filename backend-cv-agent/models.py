@@ -5,7 +5,7 @@ from langchain.schema import BaseMessage
 
 class CVAgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
-    cv_content: str
+    cv_id: str
     current_question: str
     question_type: str
     extracted_info: Dict[str, Any]
@@ -14,3 +14,4 @@ class CVAgentState(TypedDict):
     workflow_path: List[str]
     answer_attempts: int
     final_answer: str
+    deadline: float
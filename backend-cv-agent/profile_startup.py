@@ -0,0 +1,82 @@
+# profile_startup.py - Relatório de tempo de importação do startup do backend
+"""
+Mede o custo de `import main` com `python -X importtime` e falha (exit 1) se
+módulos pesados forem importados no boot ou se o orçamento for excedido.
+
+Uso:
+    python profile_startup.py [--top 15] [--budget-ms 1500]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Módulos que devem ser importados apenas na primeira requisição
+HEAVY_MODULES = ("langchain", "langchain_openai", "langgraph", "openai", "PyPDF2")
+
+PROBE = (
+    "import sys, main; "
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def run_importtime() -> tuple[list[tuple[int, int, str]], list[str]]:
+    """Executa o probe e retorna (entradas de importtime, módulos pesados carregados)"""
+    env = dict(os.environ, CV_AGENT_STARTUP_MODE="background")
+    env.setdefault("OPENAI_API_KEY", "sk-profile-placeholder")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar main:\n{proc.stderr}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return entries, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    entries, loaded = run_importtime()
+
+    # Apenas imports de nível superior somam o tempo total sem duplicidade
+    top_level = [e for e in entries if not e[2].startswith("  ")]
+    total_ms = sum(e[1] for e in top_level) / 1000
+
+    print(f"Tempo total de importação: {total_ms:.1f} ms")
+    # Imports diretos dos módulos de nível superior (ex.: o que `main` puxa)
+    direct = [e for e in entries if not e[2].startswith("    ")]
+    print(f"\nTop {args.top} imports por tempo acumulado:")
+    print(f"{'acumulado (ms)':>15} {'próprio (ms)':>13}  módulo")
+    for self_us, cumulative_us, name in sorted(direct, key=lambda e: -e[1])[
+        : args.top
+    ]:
+        print(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>13.1f}  {name.strip()}")
+
+    failed = False
+    if loaded:
+        print(f"\nERRO: módulos pesados importados no startup: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nERRO: orçamento de {args.budget_ms:.0f} ms excedido")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,176 @@
 # server.py - FastAPI server implementation
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from cv_agent import CVAgent
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from graph_artifacts import (
+    ensure_graph_artifacts,
+    load_graph_mermaid,
+    load_graph_png,
+    save_graph_artifacts,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Modos de inicialização do CV Agent:
+#   eager      - constrói o agent (langchain, langgraph, openai) no boot
+#   background - sobe o servidor imediatamente e constrói o agent em seguida
+#   lazy       - constrói o agent apenas na primeira requisição que o utiliza
+STARTUP_MODES = ("eager", "background", "lazy")
+
+# Intervalo de verificação de desconexão do cliente durante /ask
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Campos disponíveis em /ask e os retornados quando `fields` não é informado
+ASK_FIELDS = (
+    "question",
+    "answer",
+    "confidence",
+    "partial",
+    "workflow_path",
+    "tools_used",
+    "question_type",
+    "attempts",
+    "complexity",
+    "validation",
+    "cv_id",
+    "timestamp",
+)
+DEFAULT_ASK_FIELDS = (
+    "question",
+    "answer",
+    "confidence",
+    "partial",
+    "workflow_path",
+    "tools_used",
+    "question_type",
+    "attempts",
+    "cv_id",
+    "timestamp",
+)
+# Respostas menores que isso não compensam a compressão
+GZIP_MINIMUM_SIZE = 1000
+# Rotas JSON comprimidas com gzip (o PNG de /graph-image já é comprimido)
+GZIP_PATHS = ("/ask", "/extraction")
+
+
+class JSONGZipMiddleware:
+    """Aplica gzip apenas às rotas JSON listadas em `paths`"""
+
+    def __init__(self, app, paths: tuple, minimum_size: int):
+        self.app = app
+        self.paths = paths
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def parse_fields(fields: str) -> tuple:
+    """Valida a seleção `fields=a,b,c` de /ask"""
+    if not fields:
+        return DEFAULT_ASK_FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in ASK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            400, f"Campos inválidos: {', '.join(unknown)}. Disponíveis: {', '.join(ASK_FIELDS)}"
+        )
+    return selected
+
 
 class CVServer:
-    def __init__(self, openai_api_key: str):
-        self.app = FastAPI(title="CV Agent - LangGraph Powered")
+    def __init__(self, openai_api_key: str, startup_mode: str = None):
+        self.openai_api_key = openai_api_key
+        self.startup_mode = (
+            startup_mode or os.environ.get("CV_AGENT_STARTUP_MODE", "background")
+        ).lower()
+        if self.startup_mode not in STARTUP_MODES:
+            logger.warning(
+                f"Modo de inicialização inválido '{self.startup_mode}', usando 'background'"
+            )
+            self.startup_mode = "background"
+
+        self.cv_agent = None
+        self._agent_lock = asyncio.Lock()
+
+        self.app = FastAPI(
+            title="CV Agent - LangGraph Powered",
+            lifespan=self.lifespan,
+            default_response_class=ORJSONResponse,
+        )
+        self.app.add_middleware(
+            JSONGZipMiddleware, paths=GZIP_PATHS, minimum_size=GZIP_MINIMUM_SIZE
+        )
         self.app.add_middleware(
             CORSMiddleware, allow_origins=["*"], allow_methods=["*"]
         )
 
         # Initialize CV Agent
-        self.cv_agent = CVAgent(openai_api_key)
+        if self.startup_mode == "eager":
+            self.cv_agent = self._build_agent()
 
         # Setup routes
         self.setup_routes()
 
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI):
+        """Aquece o agent em segundo plano sem bloquear /health"""
+        warmup_task = None
+        if self.startup_mode == "background":
+            warmup_task = asyncio.create_task(self._warmup())
+        yield
+        if warmup_task and not warmup_task.done():
+            warmup_task.cancel()
+
+    def _build_agent(self):
+        """Importa os módulos pesados e compila o grafo"""
+        from cv_agent import CVAgent
+
+        return CVAgent(self.openai_api_key)
+
+    async def get_agent(self):
+        """Retorna o CV Agent, construindo-o na primeira chamada"""
+        if self.cv_agent is not None:
+            return self.cv_agent
+
+        async with self._agent_lock:
+            if self.cv_agent is None:
+                self.cv_agent = await asyncio.to_thread(self._build_agent)
+        return self.cv_agent
+
+    async def _warmup(self):
+        """Constrói o agent e renderiza os artefatos do grafo ausentes"""
+        try:
+            cv_agent = await self.get_agent()
+            await asyncio.to_thread(ensure_graph_artifacts, cv_agent)
+        except Exception as e:
+            logger.error(f"Erro no aquecimento do agent: {e}")
+
+    async def run_until_disconnect(self, request: Request, coro):
+        """Executa a corrotina cancelando-a se o cliente HTTP desconectar"""
+        task = asyncio.create_task(coro)
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Cliente desconectado, cancelando processamento")
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                # 499: convenção para "client closed request"
+                raise HTTPException(499, "Cliente desconectado")
+
     def setup_routes(self):
         """Setup all FastAPI routes"""
 
@@ -33,33 +182,73 @@ class CVServer:
 
             try:
                 content = await file.read()
-                result = await self.cv_agent.process_cv(content, file.filename)
+                cv_agent = await self.get_agent()
+                result = await cv_agent.process_cv(content, file.filename)
                 return result
             except Exception as e:
                 raise HTTPException(500, str(e))
 
         @self.app.post("/ask")
-        async def ask_question(question: str):
+        async def ask_question(
+            request: Request,
+            question: str,
+            timeout: float = Query(None, gt=0),
+            fields: str = None,
+        ):
             """Fazer pergunta usando LangGraph Agent"""
+            selected = parse_fields(fields)
             try:
-                result = await self.cv_agent.ask_question(question)
-                return result
+                cv_agent = await self.get_agent()
+                result = await self.run_until_disconnect(
+                    request, cv_agent.ask_question(question, timeout)
+                )
+                # Resposta enxuta, serializada com orjson (default_response_class)
+                return {field: result[field] for field in selected}
+            except HTTPException:
+                raise
             except Exception as e:
                 raise HTTPException(500, str(e))
 
+        @self.app.get("/extraction")
+        async def get_extraction(cv_id: str = None, tools: str = None):
+            """Saídas brutas das ferramentas de extração para um CV"""
+            try:
+                cv_agent = await self.get_agent()
+                tool_names = [t.strip() for t in tools.split(",")] if tools else None
+                extraction = cv_agent.get_extraction(cv_id, tool_names)
+            except Exception as e:
+                raise HTTPException(500, str(e))
+
+            if extraction is None:
+                raise HTTPException(404, "CV não encontrado")
+            return extraction
+
         @self.app.get("/health")
         async def health_check():
-            """Status do sistema"""
+            """Status do sistema (não força a construção do agent)"""
+            cv_agent = self.cv_agent
             return {
                 "status": "healthy",
-                "cv_loaded": self.cv_agent.is_cv_loaded(),
-                "cv_length": self.cv_agent.get_cv_length(),
-                "agent_ready": self.cv_agent.is_ready(),
+                "cv_loaded": cv_agent.is_cv_loaded() if cv_agent else False,
+                "cv_length": cv_agent.get_cv_length() if cv_agent else 0,
+                "agent_ready": cv_agent.is_ready() if cv_agent else False,
+                "startup_mode": self.startup_mode,
             }
 
+        @self.app.get("/metrics")
+        async def get_metrics():
+            """Métricas de trabalho evitado (prazos e cancelamentos)"""
+            return self.cv_agent.get_metrics() if self.cv_agent else {}
+
+        @self.app.get("/memory")
+        async def get_memory_report():
+            """Bytes por CV mantido em memória (comprimidos ou não)"""
+            return self.cv_agent.get_memory_report() if self.cv_agent else {}
+
         @self.app.get("/graph-info")
         async def get_graph_info():
             """Informações sobre o grafo LangGraph"""
+            cv_agent = await self.get_agent()
             return {
                 "nodes": [
                     "classifier",
@@ -70,7 +259,8 @@ class CVServer:
                     "quality_validator",
                     "confidence_calculator",
                 ],
-                "tools": self.cv_agent.get_tools(),
+                "tools": cv_agent.get_tools(),
+                "tool_inputs": cv_agent.tool_inputs,
                 "workflow_types": [
                     "need_extraction",
                     "direct_analysis",
@@ -113,7 +303,11 @@ class CVServer:
         async def get_graph_image():
             """Retorna imagem PNG do grafo LangGraph"""
             try:
-                image_data = self.cv_agent.generate_graph_image()
+                image_data = load_graph_png()
+                if not image_data:
+                    cv_agent = await self.get_agent()
+                    image_data = await asyncio.to_thread(cv_agent.generate_graph_image)
+                    save_graph_artifacts("", image_data)
                 if not image_data:
                     raise HTTPException(500, "Não foi possível gerar a imagem do grafo")
 
@@ -129,7 +323,11 @@ class CVServer:
         async def get_graph_mermaid():
             """Retorna código Mermaid do grafo"""
             try:
-                mermaid_code = self.cv_agent.get_graph_mermaid()
+                mermaid_code = load_graph_mermaid()
+                if not mermaid_code:
+                    cv_agent = await self.get_agent()
+                    mermaid_code = cv_agent.get_graph_mermaid()
+                    save_graph_artifacts(mermaid_code, b"")
                 return {"mermaid": mermaid_code}
             except Exception as e:
                 raise HTTPException(500, f"Erro ao gerar Mermaid: {str(e)}")